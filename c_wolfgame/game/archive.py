@@ -0,0 +1,152 @@
+import json
+import logging
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .engine.game import WerewolfGame
+from .engine.types import GameAction, GamePhase
+from .models import GameSession, GamePlayer, GameArchive
+from .registry import active_games, release_game, player_rows
+
+logger = logging.getLogger(__name__)
+
+# Read size used when inflating an archived timeline, so a replay page only
+# decompresses as much of the blob as it needs.
+REPLAY_CHUNK_SIZE = 4096
+
+# current_phase is stored either as the enum name or as str(GamePhase.X)
+GAME_OVER_PHASES = (GamePhase.GAME_OVER.name, str(GamePhase.GAME_OVER))
+
+
+# Archiving touches the database, so it runs off whichever thread changed the phase
+archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="werewolf-archive")
+
+
+def is_game_over(session: GameSession, game: Optional[WerewolfGame] = None) -> bool:
+    # The running engine is ahead of the stored phase, which is only written at start
+    game = game or active_games.get(session.session_id)
+    if game is not None and game.get_phase() == GamePhase.GAME_OVER:
+        return True
+    return session.current_phase in GAME_OVER_PHASES
+
+
+def encode_timeline(events: Iterable[dict]) -> bytes:
+    compressor = zlib.compressobj(level=9)
+    chunks = []
+    for event in events:
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        chunks.append(compressor.compress(line.encode('utf-8')))
+    chunks.append(compressor.flush())
+    return b''.join(chunks)
+
+
+def iter_timeline(blob: bytes) -> Iterator[dict]:
+    decompressor = zlib.decompressobj()
+    pending = b''
+    for start in range(0, len(blob), REPLAY_CHUNK_SIZE):
+        pending += decompressor.decompress(blob[start:start + REPLAY_CHUNK_SIZE])
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield json.loads(line)
+    pending += decompressor.flush()
+    for line in pending.split(b'\n'):
+        if line:
+            yield json.loads(line)
+
+
+def build_timeline(players: Iterable[GamePlayer], actions: Iterable[GameAction]) -> Iterator[dict]:
+    for player in players:
+        yield {
+            'event': 'player',
+            'player_id': player.player_id,
+            'name': player.name,
+            'role': player.role,
+            'status': player.status,
+            'is_policeman': player.is_policeman,
+        }
+    for action in actions:
+        yield {'event': 'action', **asdict(action)}
+
+
+def archive_session(session: GameSession, actions: Optional[List[GameAction]] = None,
+                    game: Optional[WerewolfGame] = None) -> GameArchive:
+    """Compress a finished session into a GameArchive row and prune its hot rows.
+
+    The roster and, without explicit actions, the timeline come from the running
+    engine when there is one, and from the GamePlayer rows otherwise. Archiving
+    the same session twice returns the first archive.
+    """
+    session_id = session.session_id
+    game = game or active_games.get(session_id)
+    try:
+        with transaction.atomic():
+            locked = GameSession.objects.select_for_update().filter(pk=session_id).first()
+            if locked is None:
+                return GameArchive.objects.get(pk=session_id)
+            if not is_game_over(locked, game):
+                raise ValueError(f"Game {session_id} is not over")
+
+            if actions is None:
+                actions = list(game.get_controller().action_queue) if game else []
+            if game is not None:
+                players = player_rows(locked, game)
+            else:
+                players = GamePlayer.objects.filter(game_session=locked).order_by('id')
+            events = list(build_timeline(players, actions))
+            archive = GameArchive.objects.create(
+                session_id=session_id,
+                final_phase=str(GamePhase.GAME_OVER),
+                round_count=game.get_round_count() if game else locked.round_count,
+                event_count=len(events),
+                timeline=encode_timeline(events),
+                started_at=locked.created_at,
+            )
+            # GamePlayer rows go with the session through the CASCADE foreign key.
+            locked.delete()
+    except IntegrityError:
+        # Lost a race with another archive of the same session
+        return GameArchive.objects.get(pk=session_id)
+    release_game(session_id)
+    return archive
+
+
+def archive_when_over(session_id, game: WerewolfGame):
+    """Archive the session in the background as soon as its engine reaches GAME_OVER."""
+    def on_phase(changed: WerewolfGame):
+        if changed.get_phase() == GamePhase.GAME_OVER:
+            future = archive_executor.submit(archive_ended_game, session_id, changed)
+            future.add_done_callback(_log_failure)
+    game.add_phase_listener(on_phase)
+
+
+def archive_ended_game(session_id, game: WerewolfGame):
+    try:
+        session = GameSession.objects.filter(pk=session_id).first()
+        if session is not None:
+            archive_session(session, game=game)
+    finally:
+        close_old_connections()
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("archiving ended game failed", exc_info=future.exception())
+
+
+def archive_finished_games() -> int:
+    """Archive every finished session; a catch-up for games that ended on another node."""
+    archived = 0
+    for session in list(GameSession.objects.filter(current_phase__in=GAME_OVER_PHASES)):
+        archive_session(session)
+        archived += 1
+    return archived
+
+
+def read_replay(session_id, offset: int = 0, limit: int = 100) -> Iterator[dict]:
+    archive = GameArchive.objects.only('timeline').get(pk=session_id)
+    return islice(iter_timeline(bytes(archive.timeline)), offset, offset + limit)
@@ -0,0 +1,155 @@
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .engine.game import WerewolfGame, Player, ROLE_PRESET
+from .engine.types import GamePhase, Role
+
+logger = logging.getLogger(__name__)
+
+BOT_ID_PREFIX = "bot-"
+
+
+def fill_with_bots(players: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    seats = list(players)
+    taken = {player_id for player_id, _ in seats}
+    i = 0
+    while len(seats) < len(ROLE_PRESET):
+        player_id = f"{BOT_ID_PREFIX}{i}"
+        i += 1
+        if player_id in taken:
+            continue
+        seats.append((player_id, f"Bot {len(seats) - len(players) + 1}"))
+    return seats
+
+
+class BotAgent:
+    """Picks one action for a bot seat in the current phase.
+
+    Agents get a deadline and fall back to a random choice once it passes,
+    so heavier strategies can't stall the worker pool.
+    """
+
+    def decide(self, game: WerewolfGame, player: Player, deadline: float) -> Optional[Tuple[str, Optional[str]]]:
+        phase = game.get_phase()
+        if phase == GamePhase.NIGHT:
+            return self.night_action(game, player, deadline)
+        if phase == GamePhase.VOTING:
+            target = self.pick(self.vote_candidates(game, player))
+            return ("vote", target.player_id) if target else None
+        return None
+
+    def night_action(self, game: WerewolfGame, player: Player, deadline: float) -> Optional[Tuple[str, Optional[str]]]:
+        return None
+
+    def vote_candidates(self, game: WerewolfGame, player: Player) -> List[Player]:
+        return self.others(game, player)
+
+    @staticmethod
+    def others(game: WerewolfGame, player: Player) -> List[Player]:
+        return [p for p in game.get_players() if p.is_alive() and p.player_id != player.player_id]
+
+    @staticmethod
+    def pick(candidates: List[Player]) -> Optional[Player]:
+        return random.choice(candidates) if candidates else None
+
+    @staticmethod
+    def earlier_targets(game: WerewolfGame, action_type: str, player_ids: Set[str],
+                        deadline: float) -> Optional[List[str]]:
+        """Targets of earlier actions by these players, or None if the deadline passed first."""
+        targets = []
+        for action in list(game.get_controller().action_queue):
+            if time.monotonic() > deadline:
+                return None
+            if action.action_type == action_type and action.player_id in player_ids:
+                targets.append(action.target_id)
+        return targets
+
+
+class WerewolfBot(BotAgent):
+    def night_action(self, game, player, deadline):
+        candidates = self.vote_candidates(game, player)
+        # Join the pack's latest kill target; a random one if out of time
+        wolves = {p.player_id for p in game.get_players() if p.get_role() == Role.WEREWOLF}
+        targets = self.earlier_targets(game, "kill", wolves, deadline) or []
+        alive_ids = {p.player_id for p in candidates}
+        for target_id in reversed(targets):
+            if target_id in alive_ids:
+                return "kill", target_id
+        target = self.pick(candidates)
+        return ("kill", target.player_id) if target else None
+
+    def vote_candidates(self, game, player):
+        # Never target another werewolf
+        return [p for p in self.others(game, player) if p.get_role() != Role.WEREWOLF]
+
+
+class SeerBot(BotAgent):
+    def night_action(self, game, player, deadline):
+        candidates = self.others(game, player)
+        # Prefer someone not checked yet; a random one if out of time
+        checked = self.earlier_targets(game, "check", {player.player_id}, deadline)
+        if checked is not None:
+            candidates = [p for p in candidates if p.player_id not in checked] or candidates
+        target = self.pick(candidates)
+        return ("check", target.player_id) if target else None
+
+
+class WitchBot(BotAgent):
+    def night_action(self, game, player, deadline):
+        # Holds the potions until the engine tells the witch who was attacked
+        return None
+
+
+BOT_AGENTS: Dict[Role, BotAgent] = {
+    Role.WEREWOLF: WerewolfBot(),
+    Role.VILLAGER: BotAgent(),
+    Role.SEER: SeerBot(),
+    Role.WITCH: WitchBot(),
+    Role.HUNTER: BotAgent(),
+    Role.IDIOT: BotAgent(),
+}
+
+
+class BotWorkerPool:
+    """Runs bot decisions off the request path, one task per game and phase.
+
+    Listen to a game's phase changes with
+    `game.add_phase_listener(functools.partial(pool.schedule, bot_ids=...))`.
+    """
+
+    def __init__(self, max_workers: int, think_time: float):
+        self.think_time = think_time
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="werewolf-bot")
+
+    def schedule(self, game: WerewolfGame, bot_ids: Set[str]):
+        future = self._executor.submit(self.play_phase, game, bot_ids)
+        future.add_done_callback(self._log_failure)
+
+    def play_phase(self, game: WerewolfGame, bot_ids: Set[str]):
+        controller = game.get_controller()
+        for player in game.get_players():
+            if player.player_id not in bot_ids or not player.is_alive():
+                continue
+            deadline = time.monotonic() + self.think_time
+            decision = BOT_AGENTS[player.get_role()].decide(game, player, deadline)
+            if time.monotonic() > deadline:
+                logger.warning(f"bot {player.player_id} overran its {self.think_time}s think time")
+            if decision is None:
+                continue
+            action_type, target_id = decision
+            success, msg = controller.submit_action(action_type, target_id, player_id=player.player_id)
+            if not success:
+                logger.info(f"bot {player.player_id} action {action_type} rejected: {msg}")
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.error("bot phase failed", exc_info=future.exception())
+
+
+bot_pool = BotWorkerPool(settings.BOT_WORKERS, settings.BOT_THINK_TIME)
@@ -1,34 +1,141 @@
 # game/consumer.py
+import asyncio
 import logging
+import time
+import uuid
+from urllib.parse import parse_qs
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from .matchmaking import matchmaking_queue, create_match, validate_lobby_player
+from .registry import active_games
+from .presence import PresenceMap, issue_seat_token, verify_seat_token
+from .throttle import TokenBucket, RoomBuckets, Outbox
 
 logger = logging.getLogger(__name__)
 
+# Only the latest of these is worth delivering to a client that falls behind
+COALESCED_MESSAGE_TYPES = {'phase_update', 'state_update'}
+
+# Close codes: seat taken over by a newer socket, no heartbeat, rate limited,
+# too slow to keep up with its outbox
+CLOSE_SEAT_TAKEN = 4001
+CLOSE_IDLE = 4002
+CLOSE_RATE_LIMITED = 4008
+CLOSE_SLOW_CONSUMER = 4009
+CLOSE_INTERNAL_ERROR = 1011
+
+room_buckets = RoomBuckets(settings.GAME_ROOM_RATE, settings.GAME_ROOM_BURST)
+presence = PresenceMap(settings.GAME_RECONNECT_GRACE)
+
+
+def parse_session_id(game_id: str):
+    try:
+        return uuid.UUID(game_id)
+    except ValueError:
+        return None
+
+
 class GameConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
         logger.info(f"websocket connect : {self.scope}")
         self.game_id = self.scope['url_route']['kwargs']['game_id']
         self.room_group_name = f'game_{self.game_id}'
+        self.rate_limiter = TokenBucket(settings.GAME_SOCKET_RATE, settings.GAME_SOCKET_BURST)
+        self.room_limiter = room_buckets.acquire(self.room_group_name)
+        # Violations drain at MAX_VIOLATIONS per window, so an occasional
+        # burst is forgiven while a sustained flood runs the bucket dry
+        self.violations = TokenBucket(
+            settings.GAME_SOCKET_MAX_VIOLATIONS / settings.GAME_SOCKET_VIOLATION_WINDOW,
+            settings.GAME_SOCKET_MAX_VIOLATIONS
+        )
+        self.closing = False
+        self.outbox = Outbox(settings.GAME_SOCKET_OUTBOX_SIZE)
+        self.writer = asyncio.create_task(self.drain_outbox())
+        self.writer.add_done_callback(self.writer_done)
+        self.last_seen = time.monotonic()
+        self.heartbeating = False
+        self.watchdog = asyncio.create_task(self.watch_idle())
+
+        # Seat binding: ?player_id=<seat>&token=<seat token> on the websocket url.
+        # Tokens are only issued for human seats, so bot seats can't be bound.
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.player_id = query.get('player_id', [None])[0]
+        session_id = parse_session_id(self.game_id)
+        game = active_games.get(session_id) if session_id else None
+        if self.player_id and not (
+            session_id and verify_seat_token(session_id, self.player_id, query.get('token', [None])[0])
+        ):
+            logger.info(f"rejecting unverified seat {self.player_id} for {self.room_group_name}")
+            self.player_id = None
+            await self.close()
+            return
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
         await self.accept()
-        await self.send_json({
-            "message": "hello",
-            "type": "welcome"
-        })
+
+        resumed = False
+        if self.player_id:
+            resumed, replaced_channel = presence.connect(self.room_group_name, self.player_id, self.channel_name)
+            if replaced_channel:
+                await self.channel_layer.send(replaced_channel, {'type': 'seat_taken'})
+            await self.broadcast_presence('online')
+
+        if resumed:
+            # Everything a reconnecting client needs, in one message
+            await self.queue({
+                "type": "resume",
+                "player_id": self.player_id,
+                "state": game.get_state(self.player_id) if game else None,
+                "online": presence.online(self.room_group_name),
+                "heartbeat_interval": settings.GAME_HEARTBEAT_INTERVAL
+            })
+        else:
+            await self.queue({
+                "message": "hello",
+                "type": "welcome",
+                "heartbeat_interval": settings.GAME_HEARTBEAT_INTERVAL
+            })
 
     async def disconnect(self, close_code):
+        self.writer.cancel()
+        self.watchdog.cancel()
+        room_buckets.release(self.room_group_name)
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if self.player_id and presence.disconnect(self.room_group_name, self.player_id, self.channel_name):
+            await self.broadcast_presence('away')
 
     async def receive_json(self, content):
-        logger.info(f"websocket receiving json content {content}")
+        self.last_seen = time.monotonic()
+        if self.closing:
+            return
+        is_ping = isinstance(content, dict) and content.get('type') == 'ping'
+        if not is_ping:
+            logger.info(f"websocket receiving json content {content}")
+        if not self.rate_limiter.consume():
+            if not self.violations.consume():
+                logger.warning(f"closing rate limited socket {self.channel_name} in {self.room_group_name}")
+                self.closing = True
+                await self.close(code=CLOSE_RATE_LIMITED)
+            else:
+                await self.queue({"type": "error", "message": "Rate limit exceeded"}, 'error:rate_limit')
+            return
+        if is_ping:
+            # Heartbeats are answered here and never reach the room
+            self.heartbeating = True
+            await self.queue({"type": "pong"}, 'pong')
+            return
+        if not self.room_limiter.consume():
+            await self.queue({"type": "error", "message": "Room is busy, try again"}, 'error:room_busy')
+            return
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -39,6 +146,169 @@ class GameConsumer(AsyncJsonWebsocketConsumer):
 
     async def game_message(self, event):
         logger.info(f"websocket receiving game message {event}")
-        await self.send_json(event['message'])
+        message = event['message']
+        message_type = message.get('type') if isinstance(message, dict) else None
+        await self.queue(message, message_type if message_type in COALESCED_MESSAGE_TYPES else None)
+
+    async def presence_update(self, event):
+        await self.queue(
+            {"type": "presence", "player_id": event['player_id'], "status": event['status']},
+            f"presence:{event['player_id']}"
+        )
+
+    async def seat_taken(self, event):
+        await self.close(code=CLOSE_SEAT_TAKEN)
+
+    async def broadcast_presence(self, status):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'presence_update',
+                'player_id': self.player_id,
+                'status': status
+            }
+        )
+
+    async def queue(self, message, coalesce_key=None):
+        # Every send goes through the outbox; one that can't be queued means
+        # the client stopped reading, so the socket is closed
+        if self.outbox.put(message, coalesce_key) or self.closing:
+            return
+        logger.warning(f"closing slow socket {self.channel_name} in {self.room_group_name}")
+        self.closing = True
+        await self.close(code=CLOSE_SLOW_CONSUMER)
+
+    async def drain_outbox(self):
+        # Sends run here rather than in game_message, so a slow client backs up
+        # its own bounded outbox instead of the consumer's inbound channel
+        while True:
+            await self.send_json(await self.outbox.get())
+
+    def writer_done(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error(f"outbox writer failed for {self.channel_name}", exc_info=task.exception())
+        asyncio.ensure_future(self.close(code=CLOSE_INTERNAL_ERROR))
 
+    async def watch_idle(self):
+        # Only seats whose client has started heartbeating are held to the
+        # timeout; spectators and clients that never ping stay open
+        while True:
+            await asyncio.sleep(settings.GAME_HEARTBEAT_INTERVAL)
+            if not (self.player_id and self.heartbeating):
+                continue
+            if time.monotonic() - self.last_seen > settings.GAME_IDLE_TIMEOUT:
+                logger.info(f"closing idle socket {self.channel_name} in {self.room_group_name}")
+                await self.close(code=CLOSE_IDLE)
+                return
 
+
+class LobbyConsumer(AsyncJsonWebsocketConsumer):
+    lobby_group_name = 'lobby'
+
+    async def connect(self):
+        self.player_id = None
+        self.bot_fill = None
+        await self.channel_layer.group_add(
+            self.lobby_group_name,
+            self.channel_name
+        )
+        await self.accept()
+        await self.send_json({
+            "type": "lobby_status",
+            "queued": len(matchmaking_queue)
+        })
+
+    async def disconnect(self, close_code):
+        self.cancel_bot_fill()
+        if self.player_id and matchmaking_queue.cancel(self.player_id, self.channel_name):
+            await self.broadcast_status()
+        await self.channel_layer.group_discard(
+            self.lobby_group_name,
+            self.channel_name
+        )
+
+    async def receive_json(self, content):
+        logger.info(f"lobby receiving json content {content}")
+        if not isinstance(content, dict):
+            return
+        if content.get('type') == 'join':
+            player_id = content.get('player_id')
+            name = content.get('name', player_id)
+            error = validate_lobby_player(player_id, name)
+            if error:
+                await self.send_json({"type": "error", "message": error})
+                return
+            if not matchmaking_queue.enqueue(player_id, name, self.channel_name):
+                await self.send_json({"type": "error", "message": "Already queued"})
+                return
+            self.player_id = player_id
+            self.cancel_bot_fill()
+            self.bot_fill = asyncio.create_task(self.fill_with_bots_after_wait())
+            await self.match_players()
+            await self.broadcast_status()
+        elif content.get('type') == 'leave':
+            if self.player_id and matchmaking_queue.cancel(self.player_id, self.channel_name):
+                self.player_id = None
+                self.cancel_bot_fill()
+                await self.broadcast_status()
+
+    async def match_players(self):
+        while (room := matchmaking_queue.pop_room()) is not None:
+            await self.start_match(room)
+
+    async def fill_with_bots_after_wait(self):
+        # Every queued player has one of these timers, so whoever has waited
+        # longest gets a game by the time theirs fires
+        await asyncio.sleep(settings.LOBBY_BOT_FILL_AFTER)
+        room = matchmaking_queue.pop_waiting_room(settings.LOBBY_BOT_FILL_AFTER)
+        if room is not None:
+            # Shielded so this player leaving doesn't strand the rest of the room
+            await asyncio.shield(self.start_match(room))
+            await self.broadcast_status()
+
+    def cancel_bot_fill(self):
+        if self.bot_fill is not None:
+            self.bot_fill.cancel()
+            self.bot_fill = None
+
+    async def start_match(self, room):
+        try:
+            session, _ = await database_sync_to_async(create_match)(room)
+        except Exception:
+            # Putting the room back would make every later join retry it,
+            # so its players are told to join again instead
+            logger.exception("failed to create matched game")
+            for entry in room:
+                await self.channel_layer.send(entry.channel_name, {'type': 'match_failed'})
+            return
+        for entry in room:
+            await self.channel_layer.send(entry.channel_name, {
+                'type': 'match_found',
+                'session_id': str(session.session_id),
+                'player_id': entry.player_id,
+                'token': issue_seat_token(session.session_id, entry.player_id)
+            })
+
+    async def broadcast_status(self):
+        await self.channel_layer.group_send(
+            self.lobby_group_name,
+            {
+                'type': 'lobby_status',
+                'queued': len(matchmaking_queue)
+            }
+        )
+
+    async def lobby_status(self, event):
+        await self.send_json({"type": "lobby_status", "queued": event['queued']})
+
+    async def match_failed(self, event):
+        await self.send_json({"type": "match_failed", "message": "Could not start the game, please join again"})
+
+    async def match_found(self, event):
+        await self.send_json({
+            "type": "match_found",
+            "session_id": event['session_id'],
+            "player_id": event['player_id'],
+            "token": event['token']
+        })
@@ -17,14 +17,19 @@ class GameController:
         self.current_player_id = player_id
         return True, f"Logged in as {player.name}"
 
-    def submit_action(self, action_type: str, target_id: Optional[str] = None) -> Tuple[bool, str]:
-        if not self.current_player_id:
+    def submit_action(self, action_type: str, target_id: Optional[str] = None,
+                      player_id: Optional[str] = None) -> Tuple[bool, str]:
+        # player_id lets server-side players (bots) act without logging in
+        player_id = player_id or self.current_player_id
+        if not player_id:
             return False, "Not logged in"
 
-        player = self.game.get_player(self.current_player_id)
+        player = self.game.get_player(player_id)
+        if not player:
+            return False, "Invalid player ID"
         if not player.is_alive():
             return False, "Dead players cannot perform actions"
 
-        action = GameAction(self.current_player_id, action_type, target_id)
+        action = GameAction(player_id, action_type, target_id)
         self.action_queue.append(action)
         return True, "Action submitted successfully"
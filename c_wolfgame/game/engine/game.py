@@ -1,8 +1,18 @@
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import random
 from .types import GamePhase, Role, PlayerStatus
 from .controller import GameController
 
+ROLE_PRESET = (
+    [Role.WEREWOLF] * 4 +
+    [Role.VILLAGER] * 4 +
+    [Role.SEER] +
+    [Role.WITCH] +
+    [Role.HUNTER] +
+    [Role.IDIOT]
+)
+
+
 class Player:
     def __init__(self, player_id: str, name: str):
         self.player_id = player_id
@@ -18,37 +28,76 @@ class Player:
     def assign_role(self, role: Role):
         self._role = role
 
+    def get_status(self) -> PlayerStatus:
+        return self._status
+
     def is_alive(self) -> bool:
         return self._status == PlayerStatus.ALIVE
 
 
 class WerewolfGame:
-    def __init__(self):
+    def __init__(self, players: Optional[List[Tuple[str, str]]] = None):
         self._players: Dict[str, Player] = {}
         self._current_phase = GamePhase.SETUP
         self._round_count = 1
         self._controller = GameController(self)
         self._witch_powers = {'heal': True, 'poison': True}
+        self._phase_listeners: List[Callable[['WerewolfGame'], None]] = []
 
-        for i in range(12):
-            player_id = f"p{i}"
-            self._players[player_id] = Player(player_id, f"Player {i}")
+        if players is None:
+            players = [(f"p{i}", f"Player {i}") for i in range(len(ROLE_PRESET))]
+        if len(players) != len(ROLE_PRESET):
+            raise ValueError(f"A game needs exactly {len(ROLE_PRESET)} players")
+        for player_id, name in players:
+            if player_id in self._players:
+                raise ValueError(f"Duplicate player ID {player_id}")
+            self._players[player_id] = Player(player_id, name)
 
     def get_player(self, player_id: str) -> Optional[Player]:
         return self._players.get(player_id)
 
-    def setup_game(self):
-        roles = (
-                [Role.WEREWOLF] * 4 +
-                [Role.VILLAGER] * 4 +
-                [Role.SEER] +
-                [Role.WITCH] +
-                [Role.HUNTER] +
-                [Role.IDIOT]
-        )
+    def get_phase(self) -> GamePhase:
+        return self._current_phase
+
+    def set_phase(self, phase: GamePhase):
+        self._current_phase = phase
+        for listener in self._phase_listeners:
+            listener(self)
+
+    def add_phase_listener(self, listener: Callable[['WerewolfGame'], None]):
+        self._phase_listeners.append(listener)
 
+    def get_round_count(self) -> int:
+        return self._round_count
+
+    def get_controller(self) -> GameController:
+        return self._controller
+
+    def get_players(self) -> List[Player]:
+        return list(self._players.values())
+
+    def get_state(self, viewer_id: Optional[str] = None) -> dict:
+        # Only the viewer's own role is revealed
+        viewer = self.get_player(viewer_id) if viewer_id else None
+        return {
+            'phase': self._current_phase.name,
+            'round': self._round_count,
+            'players': [
+                {
+                    'player_id': player.player_id,
+                    'name': player.name,
+                    'alive': player.is_alive(),
+                    'is_policeman': player.is_policeman,
+                }
+                for player in self._players.values()
+            ],
+            'role': viewer.get_role().value if viewer and viewer.get_role() else None,
+        }
+
+    def setup_game(self):
+        roles = list(ROLE_PRESET)
         random.shuffle(roles)
         for player, role in zip(self._players.values(), roles):
             player.assign_role(role)
 
-        self._current_phase = GamePhase.NIGHT
\ No newline at end of file
+        self.set_phase(GamePhase.NIGHT)
\ No newline at end of file
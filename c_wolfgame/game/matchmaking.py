@@ -0,0 +1,133 @@
+import functools
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from .archive import archive_when_over
+from .bots import BOT_ID_PREFIX, bot_pool, fill_with_bots
+from .engine.game import WerewolfGame, ROLE_PRESET
+from .models import GameSession, GamePlayer
+from .registry import register_game, player_rows
+
+ROOM_SIZE = len(ROLE_PRESET)
+PLAYER_ID_MAX_LENGTH = GamePlayer._meta.get_field('player_id').max_length
+PLAYER_NAME_MAX_LENGTH = GamePlayer._meta.get_field('name').max_length
+
+
+def validate_lobby_player(player_id, name) -> Optional[str]:
+    """Returns why a lobby join can't be queued, or None if it can."""
+    if not isinstance(player_id, str) or not player_id:
+        return "player_id must be a non-empty string"
+    if len(player_id) > PLAYER_ID_MAX_LENGTH:
+        return f"player_id must be at most {PLAYER_ID_MAX_LENGTH} characters"
+    if player_id.startswith(BOT_ID_PREFIX):
+        return f"player_id may not start with {BOT_ID_PREFIX!r}"
+    if not isinstance(name, str) or not name:
+        return "name must be a non-empty string"
+    if len(name) > PLAYER_NAME_MAX_LENGTH:
+        return f"name must be at most {PLAYER_NAME_MAX_LENGTH} characters"
+    return None
+
+
+@dataclass(order=True)
+class QueuedPlayer:
+    enqueued_at: float
+    seq: int
+    player_id: str = field(compare=False)
+    name: str = field(compare=False)
+    channel_name: Optional[str] = field(default=None, compare=False)
+
+
+class MatchmakingQueue:
+    def __init__(self, room_size: int = ROOM_SIZE):
+        self.room_size = room_size
+        self._heap: List[QueuedPlayer] = []
+        self._queued: Dict[str, QueuedPlayer] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def enqueue(self, player_id: str, name: str, channel_name: Optional[str] = None) -> bool:
+        with self._lock:
+            if player_id in self._queued:
+                return False
+            entry = QueuedPlayer(time.monotonic(), next(self._seq), player_id, name, channel_name)
+            self._queued[player_id] = entry
+            heapq.heappush(self._heap, entry)
+            return True
+
+    def cancel(self, player_id: str, channel_name: Optional[str] = None) -> bool:
+        with self._lock:
+            entry = self._queued.get(player_id)
+            if entry is None or (channel_name and entry.channel_name != channel_name):
+                return False
+            # Cancelled entries stay in the heap and are skipped when popped;
+            # rebuild once they outnumber the live ones.
+            del self._queued[player_id]
+            if len(self._heap) > 2 * len(self._queued) + self.room_size:
+                self._heap = list(self._queued.values())
+                heapq.heapify(self._heap)
+            return True
+
+    def pop_room(self) -> Optional[List[QueuedPlayer]]:
+        with self._lock:
+            if len(self._queued) < self.room_size:
+                return None
+            return self._pop(self.room_size)
+
+    def pop_waiting_room(self, max_wait: float) -> Optional[List[QueuedPlayer]]:
+        """Pops up to a room of players once the longest-waiting one has waited max_wait seconds."""
+        with self._lock:
+            while self._heap and self._queued.get(self._heap[0].player_id) is not self._heap[0]:
+                heapq.heappop(self._heap)
+            if not self._heap or time.monotonic() - self._heap[0].enqueued_at < max_wait:
+                return None
+            return self._pop(min(self.room_size, len(self._queued)))
+
+    def _pop(self, count: int) -> List[QueuedPlayer]:
+        room = []
+        while len(room) < count:
+            entry = heapq.heappop(self._heap)
+            if self._queued.get(entry.player_id) is entry:
+                del self._queued[entry.player_id]
+                room.append(entry)
+        return room
+
+
+matchmaking_queue = MatchmakingQueue()
+
+
+def build_game(players: List[Tuple[str, str]]) -> Tuple[WerewolfGame, Set[str]]:
+    """Set up a game for these players, with bots in the seats nobody took."""
+    seats = fill_with_bots(players)
+    game = WerewolfGame(seats)
+    game.setup_game()
+    return game, {player_id for player_id, _ in seats[len(players):]}
+
+
+def launch_game(session: GameSession, game: WerewolfGame, bot_ids: Set[str]):
+    register_game(session.session_id, game)
+    archive_when_over(session.session_id, game)
+    if bot_ids:
+        # Bots play the current night now and every later phase as it begins
+        game.add_phase_listener(functools.partial(bot_pool.schedule, bot_ids=bot_ids))
+        bot_pool.schedule(game, bot_ids)
+
+
+def create_match(room: List[QueuedPlayer]) -> Tuple[GameSession, WerewolfGame]:
+    """Start a game for a popped room; a partial room is filled with bots."""
+    game, bot_ids = build_game([(entry.player_id, entry.name) for entry in room])
+
+    with transaction.atomic():
+        session = GameSession.objects.create(current_phase=game.get_phase())
+        GamePlayer.objects.bulk_create(player_rows(session, game))
+
+    launch_game(session, game, bot_ids)
+    return session, game
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:13
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0002_gameplayer_gamesession_delete_game_delete_message_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GameArchive",
+            fields=[
+                (
+                    "session_id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("final_phase", models.CharField(max_length=20)),
+                ("round_count", models.IntegerField(default=1)),
+                ("event_count", models.IntegerField(default=0)),
+                ("timeline", models.BinaryField()),
+                ("started_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="gamesession",
+            name="session_id",
+            field=models.UUIDField(
+                default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+            ),
+        ),
+    ]
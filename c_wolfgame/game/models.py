@@ -16,4 +16,14 @@ class GamePlayer(models.Model):
     role = models.CharField(max_length=20)
     status = models.CharField(max_length=20)
     is_policeman = models.BooleanField(default=False)
-    running_for_policeman = models.BooleanField(default=False)
\ No newline at end of file
+    running_for_policeman = models.BooleanField(default=False)
+
+
+class GameArchive(models.Model):
+    session_id = models.UUIDField(primary_key=True, editable=False)
+    final_phase = models.CharField(max_length=20)
+    round_count = models.IntegerField(default=1)
+    event_count = models.IntegerField(default=0)
+    timeline = models.BinaryField()
+    started_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
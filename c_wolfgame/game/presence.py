@@ -0,0 +1,85 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.core import signing
+
+SEAT_TOKEN_SALT = 'game.seat'
+
+
+def issue_seat_token(session_id, player_id: str) -> str:
+    """Signed proof that the holder sits in this seat, handed out when the seat is assigned."""
+    return signing.dumps([str(session_id), player_id], salt=SEAT_TOKEN_SALT)
+
+
+def verify_seat_token(session_id, player_id: str, token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        return signing.loads(token, salt=SEAT_TOKEN_SALT) == [str(session_id), player_id]
+    except signing.BadSignature:
+        return False
+
+
+@dataclass
+class Presence:
+    channel_name: str
+    disconnected_at: Optional[float] = None
+
+
+class PresenceMap:
+    """Which socket holds each seat of a room on this node.
+
+    A seat whose socket dropped is kept for `grace` seconds so the same
+    player can reconnect and resume it.
+    """
+
+    def __init__(self, grace: float):
+        self.grace = grace
+        self._rooms: Dict[str, Dict[str, Presence]] = {}
+        self._next_sweep = 0.0
+
+    def connect(self, room: str, player_id: str, channel_name: str) -> Tuple[bool, Optional[str]]:
+        """Bind the seat to a socket.
+
+        Returns whether an existing seat was resumed, and the channel of a
+        still-open socket that held it, if any.
+        """
+        now = time.monotonic()
+        self._sweep(now)
+        seats = self._rooms.setdefault(room, {})
+        previous = seats.get(player_id)
+        seats[player_id] = Presence(channel_name)
+        if previous is None or self._expired(previous, now):
+            return False, None
+        if previous.disconnected_at is None and previous.channel_name != channel_name:
+            return True, previous.channel_name
+        return True, None
+
+    def disconnect(self, room: str, player_id: str, channel_name: str) -> bool:
+        presence = self._rooms.get(room, {}).get(player_id)
+        # The seat may already belong to a newer socket of the same player
+        if presence is None or presence.channel_name != channel_name:
+            return False
+        presence.disconnected_at = time.monotonic()
+        return True
+
+    def online(self, room: str) -> List[str]:
+        return [
+            player_id for player_id, presence in self._rooms.get(room, {}).items()
+            if presence.disconnected_at is None
+        ]
+
+    def _expired(self, presence: Presence, now: float) -> bool:
+        return presence.disconnected_at is not None and now - presence.disconnected_at > self.grace
+
+    def _sweep(self, now: float):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.grace
+        for room in list(self._rooms):
+            seats = self._rooms[room]
+            for player_id in [p for p, presence in seats.items() if self._expired(presence, now)]:
+                del seats[player_id]
+            if not seats:
+                del self._rooms[room]
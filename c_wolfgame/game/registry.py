@@ -0,0 +1,56 @@
+import functools
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .engine.game import WerewolfGame
+from .engine.types import GamePhase
+from .models import GameSession, GamePlayer
+
+# Engines of running games on this node, keyed by session id
+active_games: Dict[uuid.UUID, WerewolfGame] = {}
+_registered_at: Dict[uuid.UUID, float] = {}
+
+
+def register_game(session_id: uuid.UUID, game: WerewolfGame):
+    """Track a running engine until it reaches GAME_OVER or outlives ACTIVE_GAME_TTL."""
+    release_expired()
+    active_games[session_id] = game
+    _registered_at[session_id] = time.monotonic()
+    game.add_phase_listener(functools.partial(_release_when_over, session_id))
+
+
+def release_game(session_id: uuid.UUID) -> Optional[WerewolfGame]:
+    _registered_at.pop(session_id, None)
+    return active_games.pop(session_id, None)
+
+
+def release_expired() -> int:
+    cutoff = time.monotonic() - settings.ACTIVE_GAME_TTL
+    expired = [session_id for session_id, registered_at in list(_registered_at.items())
+               if registered_at < cutoff]
+    for session_id in expired:
+        release_game(session_id)
+    return len(expired)
+
+
+def _release_when_over(session_id: uuid.UUID, game: WerewolfGame):
+    if game.get_phase() == GamePhase.GAME_OVER and active_games.get(session_id) is game:
+        release_game(session_id)
+
+
+def player_rows(session: GameSession, game: WerewolfGame) -> List[GamePlayer]:
+    return [
+        GamePlayer(
+            game_session=session,
+            player_id=player.player_id,
+            name=player.name,
+            role=player.get_role().value,
+            status=player.get_status().name,
+            is_policeman=player.is_policeman,
+            running_for_policeman=player.running_for_policeman,
+        )
+        for player in game.get_players()
+    ]
@@ -3,4 +3,5 @@ from . import consumer
 
 websocket_urlpatterns = [
     re_path(r'ws/game/(?P<game_id>[0-9a-fA-F-]+)/$', consumer.GameConsumer.as_asgi()),
+    re_path(r'ws/lobby/$', consumer.LobbyConsumer.as_asgi()),
 ]
\ No newline at end of file
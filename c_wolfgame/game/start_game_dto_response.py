@@ -6,4 +6,4 @@ class StartGameResponseDto:
     phase: str
 
     def to_json(self):
-        return asdict(self)
+        return asdict(self)
\ No newline at end of file
@@ -1,3 +1,476 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from .archive import encode_timeline, iter_timeline, build_timeline, is_game_over, archive_when_over
+from . import consumer
+from .bots import fill_with_bots, BOT_ID_PREFIX, BotWorkerPool, WerewolfBot, SeerBot
+from .engine.game import WerewolfGame, ROLE_PRESET
+from .engine.types import GameAction, GamePhase, PlayerStatus, Role
+from .matchmaking import MatchmakingQueue, validate_lobby_player, build_game
+from .models import GamePlayer, GameSession
+from .presence import PresenceMap, issue_seat_token, verify_seat_token
+from .registry import player_rows, active_games, register_game, release_expired
+from .routing import websocket_urlpatterns
+from .throttle import TokenBucket, RoomBuckets, Outbox
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class TimelineTests(SimpleTestCase):
+    def test_round_trip(self):
+        events = [{'event': 'action', 'i': i, 'text': 'x' * (i % 7)} for i in range(500)]
+        self.assertEqual(list(iter_timeline(encode_timeline(events))), events)
+
+    def test_lines_split_across_chunks(self):
+        events = [{'event': 'action', 'i': i} for i in range(200)]
+        blob = encode_timeline(events)
+        # Chunk sizes that cut compressed and decompressed lines at odd offsets
+        for chunk_size in (1, 3, 17, len(blob)):
+            with mock.patch('game.archive.REPLAY_CHUNK_SIZE', chunk_size):
+                self.assertEqual(list(iter_timeline(blob)), events)
+
+    def test_empty_timeline(self):
+        self.assertEqual(list(iter_timeline(encode_timeline([]))), [])
+
+    def test_build_timeline_lists_players_before_actions(self):
+        players = [GamePlayer(player_id='p0', name='Ann', role='SEER', status='ALIVE')]
+        actions = [GameAction('p0', 'check', 'p1')]
+        events = list(build_timeline(players, actions))
+        self.assertEqual([e['event'] for e in events], ['player', 'action'])
+        self.assertEqual(events[1]['target_id'], 'p1')
+
+
+
+class GameOverArchiveTests(SimpleTestCase):
+    def setUp(self):
+        self.game = WerewolfGame()
+        self.game.setup_game()
+        self.session = GameSession(current_phase=str(GamePhase.NIGHT))
+
+    def test_engine_phase_wins_over_stored_phase(self):
+        self.assertFalse(is_game_over(self.session, self.game))
+        self.game.set_phase(GamePhase.GAME_OVER)
+        self.assertTrue(is_game_over(self.session, self.game))
+
+    def test_archives_only_when_game_over(self):
+        with mock.patch('game.archive.archive_executor.submit') as submit:
+            archive_when_over(self.session.session_id, self.game)
+            self.game.set_phase(GamePhase.VOTING)
+            submit.assert_not_called()
+            self.game.set_phase(GamePhase.GAME_OVER)
+            submit.assert_called_once()
+            self.assertEqual(submit.call_args.args[1:], (self.session.session_id, self.game))
+
+    def test_roster_comes_from_engine_state(self):
+        dead = self.game.get_player('p3')
+        dead._status = PlayerStatus.DEAD
+        rows = {row.player_id: row for row in player_rows(self.session, self.game)}
+        self.assertEqual(rows['p3'].status, 'DEAD')
+        self.assertEqual(rows['p4'].status, 'ALIVE')
+
+
+class MatchmakingQueueTests(SimpleTestCase):
+    def test_pops_full_rooms_in_join_order(self):
+        queue = MatchmakingQueue(room_size=3)
+        for i in range(4):
+            queue.enqueue(f"u{i}", f"U{i}")
+        self.assertEqual([e.player_id for e in queue.pop_room()], ['u0', 'u1', 'u2'])
+        self.assertIsNone(queue.pop_room())
+        self.assertEqual(len(queue), 1)
+
+    def test_duplicate_join_is_rejected(self):
+        queue = MatchmakingQueue(room_size=3)
+        self.assertTrue(queue.enqueue('u0', 'U0'))
+        self.assertFalse(queue.enqueue('u0', 'U0'))
+        self.assertEqual(len(queue), 1)
+
+    def test_cancelled_players_are_skipped(self):
+        queue = MatchmakingQueue(room_size=2)
+        queue.enqueue('u0', 'U0')
+        queue.enqueue('u1', 'U1')
+        queue.cancel('u0')
+        self.assertIsNone(queue.pop_room())
+        queue.enqueue('u2', 'U2')
+        self.assertEqual([e.player_id for e in queue.pop_room()], ['u1', 'u2'])
+
+    def test_rejoin_after_cancel_goes_to_the_back(self):
+        queue = MatchmakingQueue(room_size=2)
+        queue.enqueue('u0', 'U0')
+        queue.enqueue('u1', 'U1')
+        queue.cancel('u0')
+        queue.enqueue('u0', 'U0')
+        room = queue.pop_room()
+        self.assertEqual([e.player_id for e in room], ['u1', 'u0'])
+        self.assertEqual(len(queue), 0)
+
+    def test_cancel_only_from_owning_channel(self):
+        queue = MatchmakingQueue(room_size=2)
+        queue.enqueue('u0', 'U0', channel_name='a')
+        self.assertFalse(queue.cancel('u0', channel_name='b'))
+        self.assertTrue(queue.cancel('u0', channel_name='a'))
+        self.assertFalse(queue.cancel('u0'))
+
+    def test_partial_room_is_popped_once_the_oldest_has_waited(self):
+        queue = MatchmakingQueue(room_size=3)
+        with mock.patch('game.matchmaking.time.monotonic', return_value=1000.0) as clock:
+            queue.enqueue('u0', 'U0')
+            queue.enqueue('u1', 'U1')
+            queue.cancel('u0')
+            clock.return_value = 1005.0
+            queue.enqueue('u2', 'U2')
+            self.assertIsNone(queue.pop_waiting_room(max_wait=10))
+            clock.return_value = 1010.0
+            room = queue.pop_waiting_room(max_wait=10)
+        self.assertEqual([e.player_id for e in room], ['u1', 'u2'])
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.pop_waiting_room(max_wait=0))
+
+    def test_heap_is_rebuilt_when_mostly_cancelled(self):
+        queue = MatchmakingQueue(room_size=2)
+        for i in range(20):
+            queue.enqueue(f"u{i}", f"U{i}")
+        for i in range(19):
+            queue.cancel(f"u{i}")
+        self.assertLessEqual(len(queue._heap), 2 * len(queue) + queue.room_size)
+        queue.enqueue('late', 'Late')
+        self.assertEqual([e.player_id for e in queue.pop_room()], ['u19', 'late'])
+
+
+
+class GameRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.session_id = GameSession().session_id
+        self.game = WerewolfGame()
+        self.addCleanup(active_games.pop, self.session_id, None)
+
+    def test_engine_is_released_on_game_over(self):
+        register_game(self.session_id, self.game)
+        self.game.set_phase(GamePhase.NIGHT)
+        self.assertIs(active_games.get(self.session_id), self.game)
+        self.game.set_phase(GamePhase.GAME_OVER)
+        self.assertNotIn(self.session_id, active_games)
+
+    def test_replaced_engine_is_not_released_by_the_old_one(self):
+        register_game(self.session_id, self.game)
+        newer = WerewolfGame()
+        register_game(self.session_id, newer)
+        self.game.set_phase(GamePhase.GAME_OVER)
+        self.assertIs(active_games.get(self.session_id), newer)
+
+    @override_settings(ACTIVE_GAME_TTL=60)
+    def test_engines_expire_after_ttl(self):
+        with mock.patch('game.registry.time.monotonic', return_value=1000.0) as clock:
+            register_game(self.session_id, self.game)
+            clock.return_value = 1059.0
+            self.assertEqual(release_expired(), 0)
+            clock.return_value = 1061.0
+            self.assertEqual(release_expired(), 1)
+        self.assertNotIn(self.session_id, active_games)
+
+
+class LobbyValidationTests(SimpleTestCase):
+    def test_accepts_valid_player(self):
+        self.assertIsNone(validate_lobby_player('alice', 'Alice'))
+
+    def test_rejects_bad_player_id(self):
+        for player_id in (None, '', {'id': 1}, 7, 'x' * 51, 'bot-0'):
+            self.assertIsNotNone(validate_lobby_player(player_id, 'Alice'))
+
+    def test_rejects_bad_name(self):
+        for name in (None, '', ['a'], 'n' * 101):
+            self.assertIsNotNone(validate_lobby_player('alice', name))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        with mock.patch('game.throttle.time.monotonic', return_value=100.0) as clock:
+            bucket = TokenBucket(rate=2, capacity=3)
+            self.assertEqual([bucket.consume() for _ in range(4)], [True, True, True, False])
+            clock.return_value = 100.5
+            self.assertTrue(bucket.consume())
+            self.assertFalse(bucket.consume())
+
+    def test_refill_is_capped_at_capacity(self):
+        with mock.patch('game.throttle.time.monotonic', return_value=0.0) as clock:
+            bucket = TokenBucket(rate=10, capacity=2)
+            clock.return_value = 60.0
+            self.assertEqual([bucket.consume() for _ in range(3)], [True, True, False])
+
+
+class RoomBucketsTests(SimpleTestCase):
+    def test_room_bucket_is_shared_until_last_release(self):
+        rooms = RoomBuckets(rate=1, capacity=1)
+        first = rooms.acquire('game_a')
+        self.assertIs(rooms.acquire('game_a'), first)
+        rooms.release('game_a')
+        self.assertIs(rooms.acquire('game_a'), first)
+        rooms.release('game_a')
+        rooms.release('game_a')
+        self.assertIsNot(rooms.acquire('game_a'), first)
+
+
+class OutboxTests(SimpleTestCase):
+    def drain(self, outbox):
+        async def take():
+            return [await outbox.get() for _ in range(len(outbox))]
+        return asyncio.run(take())
+
+    def test_coalesced_message_replaces_queued_one(self):
+        outbox = Outbox(maxsize=10)
+        outbox.put({'n': 1})
+        outbox.put({'phase': 'NIGHT'}, 'phase_update')
+        outbox.put({'n': 2})
+        outbox.put({'phase': 'DAY'}, 'phase_update')
+        self.assertEqual(self.drain(outbox), [{'n': 1}, {'n': 2}, {'phase': 'DAY'}])
+        self.assertEqual(outbox.dropped, 1)
+
+    def test_overflow_drops_oldest_coalesced(self):
+        outbox = Outbox(maxsize=3)
+        outbox.put({'n': 0})
+        outbox.put({'phase': 'NIGHT'}, 'phase_update')
+        outbox.put({'v': 1}, 'state_update')
+        self.assertTrue(outbox.put({'n': 1}))
+        self.assertEqual(self.drain(outbox), [{'n': 0}, {'v': 1}, {'n': 1}])
+        self.assertEqual(outbox.dropped, 1)
+
+    def test_overflow_without_coalesced_messages_is_refused(self):
+        outbox = Outbox(maxsize=2)
+        self.assertTrue(outbox.put({'n': 0}))
+        self.assertTrue(outbox.put({'n': 1}))
+        self.assertFalse(outbox.put({'n': 2}))
+        self.assertFalse(outbox.put({'v': 1}, 'state_update'))
+        self.assertEqual(self.drain(outbox), [{'n': 0}, {'n': 1}])
+        self.assertEqual(outbox.dropped, 0)
+
+    def test_coalesce_does_not_count_as_overflow(self):
+        outbox = Outbox(maxsize=2)
+        outbox.put({'n': 0})
+        outbox.put({'v': 1}, 'state_update')
+        outbox.put({'v': 2}, 'state_update')
+        self.assertEqual(self.drain(outbox), [{'n': 0}, {'v': 2}])
+
+    def test_get_waits_for_put(self):
+        async def scenario():
+            outbox = Outbox(maxsize=2)
+            waiter = asyncio.ensure_future(outbox.get())
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            outbox.put({'n': 1})
+            return await asyncio.wait_for(waiter, 1)
+        self.assertEqual(asyncio.run(scenario()), {'n': 1})
+
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, GAME_SOCKET_OUTBOX_SIZE=1)
+class SlowSocketTests(SimpleTestCase):
+    async def test_socket_is_closed_when_its_outbox_overflows(self):
+        async def stalled_writer(self):
+            await asyncio.Event().wait()
+
+        with mock.patch.object(consumer.GameConsumer, 'drain_outbox', stalled_writer):
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), f'/ws/game/{GameSession().session_id}/'
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            # The welcome fills the outbox; the next message can't be queued
+            await communicator.send_json_to({'type': 'chat', 'text': 'hi'})
+            output = await communicator.receive_output(timeout=1)
+            self.assertEqual(output, {'type': 'websocket.close', 'code': consumer.CLOSE_SLOW_CONSUMER})
+            await communicator.disconnect()
+
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, GAME_HEARTBEAT_INTERVAL=0.05, GAME_IDLE_TIMEOUT=0.1)
+class GameConsumerTests(SimpleTestCase):
+    def setUp(self):
+        self.session_id = GameSession().session_id
+        self.addCleanup(active_games.pop, self.session_id, None)
+
+    async def connect_seat(self, player_id):
+        token = issue_seat_token(self.session_id, player_id)
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f'/ws/game/{self.session_id}/?player_id={player_id}&token={token}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_type(self, communicator, message_type):
+        while True:
+            message = await communicator.receive_json_from(timeout=1)
+            if message['type'] == message_type:
+                return message
+
+    async def test_heartbeating_seat_is_closed_when_idle(self):
+        communicator = await self.connect_seat('alice')
+        await self.receive_type(communicator, 'welcome')
+        await communicator.send_json_to({'type': 'ping'})
+        await self.receive_type(communicator, 'pong')
+        while (output := await communicator.receive_output(timeout=1))['type'] != 'websocket.close':
+            pass
+        self.assertEqual(output['code'], consumer.CLOSE_IDLE)
+
+    async def test_socket_that_never_pings_stays_open(self):
+        communicator = await self.connect_seat('alice')
+        await self.receive_type(communicator, 'welcome')
+        await communicator.receive_json_from(timeout=1)  # alice's own presence update
+        self.assertTrue(await communicator.receive_nothing(timeout=0.3))
+        await communicator.disconnect()
+
+    async def test_reconnect_resumes_the_seat(self):
+        game, _ = build_game([('alice', 'Alice')])
+        active_games[self.session_id] = game
+        first = await self.connect_seat('alice')
+        await self.receive_type(first, 'welcome')
+        await first.disconnect()
+
+        second = await self.connect_seat('alice')
+        resume = await self.receive_type(second, 'resume')
+        await second.disconnect()
+        self.assertEqual(resume['player_id'], 'alice')
+        self.assertEqual(resume['online'], ['alice'])
+        self.assertEqual(resume['state'], game.get_state('alice'))
+
+
+class FillWithBotsTests(SimpleTestCase):
+    def test_fills_every_empty_seat(self):
+        seats = fill_with_bots([('alice', 'Alice')])
+        self.assertEqual(len(seats), len(ROLE_PRESET))
+        self.assertEqual(seats[0], ('alice', 'Alice'))
+        self.assertTrue(all(player_id.startswith(BOT_ID_PREFIX) for player_id, _ in seats[1:]))
+
+    def test_bot_ids_skip_taken_ids(self):
+        seats = fill_with_bots([('bot-0', 'human'), ('alice', 'a')])
+        player_ids = [player_id for player_id, _ in seats]
+        self.assertEqual(len(set(player_ids)), len(ROLE_PRESET))
+        self.assertEqual(player_ids.count('bot-0'), 1)
+
+    def test_game_rejects_duplicate_ids(self):
+        seats = [('p0', 'A')] + [(f"p{i}", 'B') for i in range(len(ROLE_PRESET) - 1)]
+        with self.assertRaises(ValueError):
+            WerewolfGame(seats)
+
+
+class BotAgentTests(SimpleTestCase):
+    def setUp(self):
+        self.game = WerewolfGame(fill_with_bots([]))
+        roles = list(ROLE_PRESET)
+        for player, role in zip(self.game.get_players(), roles):
+            player.assign_role(role)
+        self.game.set_phase(GamePhase.NIGHT)
+        self.wolves = [p for p in self.game.get_players() if p.get_role() == Role.WEREWOLF]
+        self.seer = next(p for p in self.game.get_players() if p.get_role() == Role.SEER)
+
+    def test_werewolves_join_the_pack_target(self):
+        self.game.get_controller().submit_action('kill', 'bot-7', player_id=self.wolves[0].player_id)
+        decision = WerewolfBot().decide(self.game, self.wolves[1], deadline=float('inf'))
+        self.assertEqual(decision, ('kill', 'bot-7'))
+
+    def test_past_deadline_falls_back_to_a_random_target(self):
+        self.game.get_controller().submit_action('check', 'bot-0', player_id=self.seer.player_id)
+        with mock.patch('game.bots.random.choice', side_effect=lambda c: c[0]):
+            decision = SeerBot().decide(self.game, self.seer, deadline=0)
+        self.assertEqual(decision, ('check', 'bot-0'))
+
+    def test_werewolves_never_vote_for_werewolves(self):
+        self.game.set_phase(GamePhase.VOTING)
+        for _ in range(20):
+            _, target_id = WerewolfBot().decide(self.game, self.wolves[0], deadline=float('inf'))
+            self.assertNotEqual(self.game.get_player(target_id).get_role(), Role.WEREWOLF)
+
+    def test_phase_listeners_run_on_phase_change(self):
+        seen = []
+        self.game.add_phase_listener(lambda game: seen.append(game.get_phase()))
+        self.game.set_phase(GamePhase.VOTING)
+        self.assertEqual(seen, [GamePhase.VOTING])
+
+
+class MixedRoomTests(SimpleTestCase):
+    def test_bots_take_empty_seats_and_only_play_those(self):
+        game, bot_ids = build_game([('alice', 'Alice'), ('bob', 'Bob')])
+        seat_ids = [p.player_id for p in game.get_players()]
+        self.assertEqual(len(seat_ids), len(ROLE_PRESET))
+        self.assertEqual(bot_ids, set(seat_ids) - {'alice', 'bob'})
+
+        BotWorkerPool(max_workers=1, think_time=1.0).play_phase(game, bot_ids)
+        actors = {action.player_id for action in game.get_controller().action_queue}
+        # Two humans can't hold every werewolf and the seer, so some bot acts
+        self.assertTrue(actors)
+        self.assertTrue(actors <= bot_ids)
+
+    @override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, LOBBY_BOT_FILL_AFTER=0)
+    async def test_lobby_fills_a_waiting_room_with_bots(self):
+        session = GameSession()
+        create_match = mock.Mock(return_value=(session, None))
+        with mock.patch.object(consumer, 'matchmaking_queue', MatchmakingQueue()), \
+                mock.patch.object(consumer, 'create_match', create_match):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/lobby/')
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({'type': 'join', 'player_id': 'alice', 'name': 'Alice'})
+            messages = [await communicator.receive_json_from(timeout=1) for _ in range(3)]
+            await communicator.disconnect()
+
+        (room,), _ = create_match.call_args
+        self.assertEqual([entry.player_id for entry in room], ['alice'])
+        found = next(m for m in messages if m['type'] == 'match_found')
+        self.assertEqual(found['session_id'], str(session.session_id))
+        self.assertTrue(verify_seat_token(session.session_id, 'alice', found['token']))
+
+
+class PresenceMapTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('game.presence.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.presence = PresenceMap(grace=30)
+
+    def test_first_connect_is_not_a_resume(self):
+        self.assertEqual(self.presence.connect('room', 'p1', 'a'), (False, None))
+        self.assertEqual(self.presence.online('room'), ['p1'])
+
+    def test_reconnect_within_grace_resumes(self):
+        self.presence.connect('room', 'p1', 'a')
+        self.assertTrue(self.presence.disconnect('room', 'p1', 'a'))
+        self.assertEqual(self.presence.online('room'), [])
+        self.clock.return_value += 29
+        self.assertEqual(self.presence.connect('room', 'p1', 'b'), (True, None))
+
+    def test_reconnect_after_grace_starts_fresh(self):
+        self.presence.connect('room', 'p1', 'a')
+        self.presence.disconnect('room', 'p1', 'a')
+        self.clock.return_value += 31
+        self.assertEqual(self.presence.connect('room', 'p1', 'b'), (False, None))
+
+    def test_takeover_returns_the_open_socket(self):
+        self.presence.connect('room', 'p1', 'a')
+        self.assertEqual(self.presence.connect('room', 'p1', 'b'), (True, 'a'))
+        # The replaced socket's disconnect must not mark the seat away
+        self.assertFalse(self.presence.disconnect('room', 'p1', 'a'))
+        self.assertEqual(self.presence.online('room'), ['p1'])
+
+    def test_sweep_drops_expired_rooms(self):
+        self.presence.connect('old', 'p1', 'a')
+        self.presence.disconnect('old', 'p1', 'a')
+        self.clock.return_value += 61
+        self.presence.connect('new', 'p2', 'b')
+        self.assertNotIn('old', self.presence._rooms)
+
+
+class SeatTokenTests(SimpleTestCase):
+    def test_token_binds_session_and_seat(self):
+        token = issue_seat_token('session-a', 'p1')
+        self.assertTrue(verify_seat_token('session-a', 'p1', token))
+        self.assertFalse(verify_seat_token('session-a', 'p2', token))
+        self.assertFalse(verify_seat_token('session-b', 'p1', token))
+
+    def test_missing_or_forged_token_is_rejected(self):
+        self.assertFalse(verify_seat_token('session-a', 'p1', None))
+        self.assertFalse(verify_seat_token('session-a', 'p1', 'not-a-token'))
+        self.assertFalse(verify_seat_token('session-a', 'p1', issue_seat_token('session-a', 'p1') + 'x'))
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def consume(self, tokens: float = 1) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+
+class RoomBuckets:
+    """Token buckets shared by every local socket of a room, freed with the last one."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._rooms: Dict[str, Tuple[TokenBucket, int]] = {}
+
+    def acquire(self, room: str) -> TokenBucket:
+        bucket, count = self._rooms.get(room, (None, 0))
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+        self._rooms[room] = (bucket, count + 1)
+        return bucket
+
+    def release(self, room: str):
+        bucket, count = self._rooms.get(room, (None, 0))
+        if count <= 1:
+            self._rooms.pop(room, None)
+        else:
+            self._rooms[room] = (bucket, count - 1)
+
+
+class Outbox:
+    """Bounded outbound queue for one socket.
+
+    Messages sharing a coalesce key replace the queued one, so a slow client
+    only receives the latest state. When full, the oldest coalescable message
+    is dropped; messages without a key are never dropped, and `put` returns
+    False instead so the caller can close the socket.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._messages: OrderedDict = OrderedDict()
+        self._seq = 0
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def put(self, message: dict, coalesce_key: Optional[str] = None) -> bool:
+        if coalesce_key is not None and coalesce_key in self._messages:
+            del self._messages[coalesce_key]
+            self.dropped += 1
+        elif len(self._messages) >= self.maxsize:
+            # Coalesced messages are keyed by str, the others by int sequence
+            oldest = next((key for key in self._messages if isinstance(key, str)), None)
+            if oldest is None:
+                return False
+            del self._messages[oldest]
+            self.dropped += 1
+        if coalesce_key is None:
+            self._seq += 1
+            key = self._seq
+        else:
+            key = coalesce_key
+        self._messages[key] = message
+        self._ready.set()
+        return True
+
+    async def get(self) -> dict:
+        while not self._messages:
+            self._ready.clear()
+            await self._ready.wait()
+        _, message = self._messages.popitem(last=False)
+        return message
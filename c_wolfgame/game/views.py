@@ -4,14 +4,19 @@ import uuid
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import render
 
 # Create your views here.
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .engine.game import WerewolfGame
-from .models import GameSession, GamePlayer
+from .archive import archive_session, is_game_over, read_replay
+from .engine.types import PlayerStatus
+from .matchmaking import ROOM_SIZE, build_game, launch_game, validate_lobby_player
+from .models import GameSession, GamePlayer, GameArchive
+from .presence import issue_seat_token
+from .registry import player_rows
 from .serializers import GameSessionSerializer
 from .start_game_dto_response import StartGameResponseDto
 
@@ -52,14 +57,26 @@ class GameViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=['POST'])
     def start_game(self, request, pk=None):
-        session = GameSession.objects.get(pk=pk)
-        logger.info(f"session is {session}")
-        # Update the game phase
-        game = WerewolfGame()
-        game.setup_game()
-
-        session.current_phase = game._current_phase  # Example phase change
-        session.save()
+        try:
+            with transaction.atomic():
+                # Locked so two concurrent starts can't both pass the SETUP check
+                session = GameSession.objects.select_for_update().get(pk=pk)
+                logger.info(f"session is {session}")
+                if session.current_phase != 'SETUP':
+                    return Response(
+                        {'error': 'Game has already started'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                players = GamePlayer.objects.filter(game_session=session).order_by('id')
+                humans = [(p.player_id, p.name) for p in players]
+                game, bot_ids = build_game(humans)
+                players.delete()
+                GamePlayer.objects.bulk_create(player_rows(session, game))
+                session.current_phase = game.get_phase()
+                session.save()
+        except (GameSession.DoesNotExist, ValidationError):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        launch_game(session, game, bot_ids)
 
         # Notify clients via WebSocket
         channel_layer = get_channel_layer()
@@ -76,6 +93,50 @@ class GameViewSet(viewsets.ViewSet):
             StartGameResponseDto(type="phase_update", phase="Night").to_json()
         )
 
+    @action(detail=True, methods=['POST'])
+    def join(self, request, pk=None):
+        """Claim a seat in a game that hasn't started; the seat token goes to this player only."""
+        player_id = request.data.get('player_id')
+        name = request.data.get('name', player_id)
+        error = validate_lobby_player(player_id, name)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                session = GameSession.objects.select_for_update().get(pk=pk)
+                if session.current_phase != 'SETUP':
+                    return Response(
+                        {'error': 'Game has already started'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                players = GamePlayer.objects.filter(game_session=session)
+                if players.filter(player_id=player_id).exists():
+                    return Response(
+                        {'error': 'Seat is already taken'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                if players.count() >= ROOM_SIZE:
+                    return Response(
+                        {'error': 'Game is full'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                GamePlayer.objects.create(
+                    game_session=session,
+                    player_id=player_id,
+                    name=name,
+                    status=PlayerStatus.ALIVE.name
+                )
+        except (GameSession.DoesNotExist, ValidationError):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {
+                'session_id': str(session.session_id),
+                'player_id': player_id,
+                'token': issue_seat_token(session.session_id, player_id)
+            },
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=True, methods=['POST'])
     def submit_action(self, request, pk=None):
         session = GameSession.objects.get(pk=pk)
@@ -85,6 +146,45 @@ class GameViewSet(viewsets.ViewSet):
             'message': msg
         })
 
+    @action(detail=True, methods=['POST'])
+    def archive(self, request, pk=None):
+        try:
+            session = GameSession.objects.get(pk=pk)
+        except (GameSession.DoesNotExist, ValidationError):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not is_game_over(session):
+            return Response(
+                {'error': 'Game is not over'},
+                status=status.HTTP_409_CONFLICT
+            )
+        archive = archive_session(session)
+        return Response({
+            'session_id': str(archive.session_id),
+            'event_count': archive.event_count,
+            'status': 'archived'
+        })
+
+    @action(detail=True, methods=['GET'])
+    def replay(self, request, pk=None):
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', 100)), 1), 500)
+        except ValueError:
+            return Response(
+                {'error': 'offset and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            events = list(read_replay(pk, offset, limit))
+        except (GameArchive.DoesNotExist, ValidationError):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'session_id': pk,
+            'offset': offset,
+            'next_offset': offset + len(events) if len(events) == limit else None,
+            'events': events
+        })
+
     def list(self, request):
         sessions = GameSession.objects.all()
         serializer = GameSessionSerializer(sessions, many=True)
@@ -155,10 +155,45 @@ CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("127.0.0.1", 6379)]
+            "hosts": [("127.0.0.1", 6379)],
+            # bound each socket's inbound channel so a stalled consumer
+            # sheds stale game messages instead of piling them up in Redis
+            "capacity": 100,
+            "expiry": 10,
         },
     },
 }
+
+# Inbound frames per second a single game socket may send, and burst size
+GAME_SOCKET_RATE = 5
+GAME_SOCKET_BURST = 10
+# Inbound frames per second shared by all sockets of a room on this node
+GAME_ROOM_RATE = 30
+GAME_ROOM_BURST = 60
+# Rate-limited frames tolerated within GAME_SOCKET_VIOLATION_WINDOW seconds
+# before a socket is disconnected
+GAME_SOCKET_MAX_VIOLATIONS = 20
+GAME_SOCKET_VIOLATION_WINDOW = 60
+# Outbound messages buffered per socket before old ones are dropped
+GAME_SOCKET_OUTBOX_SIZE = 50
+# Seconds between client heartbeats, and silence tolerated before closing
+GAME_HEARTBEAT_INTERVAL = 15
+GAME_IDLE_TIMEOUT = 45
+# Seconds a dropped player keeps their seat and can resume it
+GAME_RECONNECT_GRACE = 60
+
+# Seconds a running game engine is kept in memory before it is released,
+# for games that never reach GAME_OVER
+ACTIVE_GAME_TTL = 6 * 60 * 60
+
+# Seconds the longest-waiting lobby player waits for a full room before the
+# players queued so far are matched and the empty seats go to bots
+LOBBY_BOT_FILL_AFTER = 30
+
+# Threads that run bot decisions, shared by every game on this node
+BOT_WORKERS = 4
+# Seconds a bot may spend choosing one action
+BOT_THINK_TIME = 0.05
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         # 'rest_framework.authentication.SessionAuthentication',